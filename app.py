@@ -2,8 +2,12 @@
 # IMPORTS
 # ============================================================
 import os
+import gzip
 import json
 import time
+import hashlib
+import mimetypes
+import threading
 import uuid
 import atexit
 import re
@@ -12,7 +16,8 @@ from urllib.parse import urlparse
 
 from flask import (
     Flask, jsonify, render_template, request,
-    redirect, url_for, session
+    redirect, url_for, session, send_file, abort,
+    Response, stream_with_context
 )
 from flask_cors import CORS
 from dotenv import load_dotenv
@@ -23,11 +28,19 @@ from reportlab.lib.pagesizes import A5
 from reportlab.pdfgen import canvas
 from PIL import Image
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from huggingface_hub import InferenceClient
 import google.generativeai as genai
 from authlib.integrations.flask_client import OAuth
+from translation_memory import tm_add, tm_lookup, tm_suggest
+from singleflight import singleflight, singleflight_stream, singleflight_totals
 from datetime import datetime
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # ============================================================
 # LOAD ENVIRONMENT VARIABLES
 # ============================================================
@@ -40,6 +53,7 @@ CORS(app)
 os.makedirs("static/audio", exist_ok=True)
 os.makedirs("static/uploads", exist_ok=True)
 os.makedirs("static/receipts", exist_ok=True)
+os.makedirs("static/generated", exist_ok=True)
 
 # ============================================================
 # DATABASE CONFIGURATION
@@ -165,6 +179,177 @@ def save_history():
     with open(history_file, "w") as f:
         json.dump(history, f, indent=4)
 
+# ============================================================
+# SINGLE-FLIGHT REQUEST COALESCING
+# ============================================================
+# SDXL generations routinely take longer than a translation deadline allows
+IMAGE_GEN_DEADLINE = float(os.getenv("IMAGE_GEN_DEADLINE", "120"))
+
+# ============================================================
+# TRANSLATION MEMORY
+# ============================================================
+# Returns (translation, similar). similar is a near-duplicate from memory,
+# looked up only when asked for and only on a miss.
+def translate_text(text, lang, suggest=False):
+    translated = tm_lookup(lang, text)
+    if translated is not None:
+        return translated, None
+
+    similar = tm_suggest(lang, text) if suggest else None
+    translated = singleflight(
+        f"translate:{lang}:{text}",
+        lambda: GoogleTranslator(source="auto", target=lang).translate(text)
+    )
+    tm_add(lang, text, translated)
+    return translated, similar
+
+for entry in reversed(history):
+    try:
+        tm_add(entry["target_lang"], entry["original_text"], entry["translated_text"])
+    except Exception as e:
+        print("Translation memory load error:", e)
+
+# ============================================================
+# STATIC ASSETS (FINGERPRINTING + PRECOMPRESSION)
+# ============================================================
+# Templates link assets through asset_url(), which embeds a content hash
+# in the filename (style.css -> style.<hash>.css). Fingerprinted URLs never
+# change content, so they are served with a one-year immutable cache.
+ASSET_MAX_AGE = 60 * 60 * 24 * 365
+ASSET_HASH_LENGTH = 12
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+FINGERPRINT_PATTERN = re.compile(
+    r"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<ext>\.[^./]+)$" % ASSET_HASH_LENGTH
+)
+
+# Per-user files (receipts carry name + email) must never be publicly cached
+PRIVATE_ASSET_DIRS = {"receipts", "uploads"}
+
+# Let the front proxy (nginx / Apache) push large media with sendfile.
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "false").lower() == "true"
+
+asset_hashes = {}
+
+def asset_digest(filename):
+    full_path = safe_join(app.static_folder, filename)
+    mtime = os.path.getmtime(full_path)
+
+    cached = asset_hashes.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    digest = hashlib.md5()
+    with open(full_path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+
+    value = digest.hexdigest()[:ASSET_HASH_LENGTH]
+    asset_hashes[filename] = (mtime, value)
+    return value
+
+def is_private_asset(full_path):
+    # Check the normalised path, so "./receipts/..." or "audio/../receipts/..." can't slip through
+    relative = os.path.relpath(full_path, app.static_folder).replace(os.sep, "/")
+    return relative.split("/", 1)[0] in PRIVATE_ASSET_DIRS
+
+def asset_url(filename):
+    full_path = safe_join(app.static_folder, filename)
+    if (not full_path or is_private_asset(full_path)
+            or not os.path.isfile(full_path)):
+        return url_for("static", filename=filename)
+
+    stem, ext = os.path.splitext(filename)
+    fingerprinted = f"{stem}.{asset_digest(filename)}{ext}"
+    return url_for("serve_asset", filename=fingerprinted)
+
+app.jinja_env.globals["asset_url"] = asset_url
+
+def write_compressed(source, target, encoding):
+    with open(source, "rb") as f:
+        data = f.read()
+
+    if encoding == "br":
+        data = brotli.compress(data, quality=11)
+    else:
+        data = gzip.compress(data, compresslevel=9, mtime=0)
+
+    # Write then rename so concurrent workers never read a partial file
+    tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, target)
+
+def precompressed_variant(full_path):
+    if os.path.splitext(full_path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return None, None
+
+    candidates = []
+    if brotli and request.accept_encodings["br"]:
+        candidates.append(("br", ".br"))
+    if request.accept_encodings["gzip"]:
+        candidates.append(("gzip", ".gz"))
+
+    for encoding, suffix in candidates:
+        target = full_path + suffix
+        if (not os.path.exists(target)
+                or os.path.getmtime(target) < os.path.getmtime(full_path)):
+            write_compressed(full_path, target, encoding)
+        return target, encoding
+
+    return None, None
+
+def precompress_static():
+    for root, _, files in os.walk(app.static_folder):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            source = os.path.join(root, name)
+            write_compressed(source, source + ".gz", "gzip")
+            if brotli:
+                write_compressed(source, source + ".br", "br")
+
+try:
+    precompress_static()
+except Exception as e:
+    print("Precompression Error:", e)
+
+@app.route("/assets/<path:filename>")
+def serve_asset(filename):
+    max_age = ASSET_MAX_AGE
+    match = FINGERPRINT_PATTERN.match(filename)
+    if match:
+        filename = match.group("stem") + match.group("ext")
+
+    full_path = safe_join(app.static_folder, filename)
+    if (not full_path or is_private_asset(full_path)
+            or not os.path.isfile(full_path)):
+        abort(404)
+
+    # Stale or missing fingerprint: serve the file but don't let it stick
+    if not match or match.group("digest") != asset_digest(filename):
+        max_age = 0
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    variant, encoding = precompressed_variant(full_path)
+
+    # conditional=True gives ETag / If-None-Match and HTTP Range (audio seeking)
+    response = send_file(
+        variant or full_path,
+        mimetype=mimetype,
+        conditional=True,
+        etag=True,
+        max_age=max_age
+    )
+
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if os.path.splitext(filename)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+        response.vary.add("Accept-Encoding")
+    if max_age:
+        response.cache_control.immutable = True
+
+    return response
+
 # ============================================================
 # BASIC ROUTES
 # ============================================================
@@ -349,16 +534,12 @@ def translate():
     if not text:
         return jsonify({"translated": "No text provided."})
 
-    translated = GoogleTranslator(source="auto", target=lang).translate(text)
+    translated, similar = translate_text(text, lang, suggest=True)
 
-    filename = ""
     audio_path = ""
 
     if play_audio:
-        filename = f"audio_{uuid.uuid4().hex}.mp3"
-        full_path = os.path.join("static/audio", filename)
-        gTTS(text=translated, lang=lang).save(full_path)
-        audio_path = f"/static/audio/{filename}"
+        audio_path = tts_url([(translated, lang)])
 
     ist=pytz.timezone("Asia/Kolkata")
     current_time = datetime.now(ist).strftime("%Y-%m-%d %H:%M-%S")
@@ -367,14 +548,139 @@ def translate():
         "target_lang": lang,
         "original_text": text,
         "translated_text": translated,
-        "audio_file": filename,
+        "audio_file": "",
+        "audio_url": audio_path,
         "timestamp": current_time
     })
 
-    return jsonify({
+    response = {
         "translated": translated,
         "audio_path": audio_path
-    })
+    }
+
+    # Near-duplicate from memory, shown as a hint only
+    if similar:
+        response["similar"] = similar
+
+    return jsonify(response)
+
+# ============================================================
+# STREAMED TEXT TO SPEECH
+# ============================================================
+# Audio is no longer written to static/audio. Translation responses carry a
+# /tts/<id> URL; the (text, lang) pairs to speak are kept server-side in a
+# small JSON file named by their content hash, so URLs stay short however
+# long the text, and only text this app translated can be spoken. The
+# endpoint pipes gTTS output to the client as each part is decoded.
+TTS_MAX_AGE = 300
+TTS_DIR = os.getenv("TTS_DIR", "tts_items")
+TTS_RETENTION = float(os.getenv("TTS_RETENTION_DAYS", "7")) * 24 * 60 * 60
+TTS_PRUNE_INTERVAL = 60 * 60
+TTS_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+os.makedirs(TTS_DIR, exist_ok=True)
+
+tts_last_prune = [0.0]
+tts_prune_lock = threading.Lock()
+
+def tts_url(items):
+    payload = json.dumps([list(item) for item in items], ensure_ascii=False)
+    tts_id = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+    path = os.path.join(TTS_DIR, tts_id + ".json")
+
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    prune_tts_items()
+    return url_for("stream_tts", tts_id=tts_id)
+
+def history_tts_ids():
+    # Other workers keep their own history list, so also read what's on disk
+    entries = list(history)
+    try:
+        with open(history_file, "r") as f:
+            entries += json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    return {
+        entry["audio_url"].rstrip("/").rsplit("/", 1)[-1]
+        for entry in entries if entry.get("audio_url")
+    }
+
+def prune_tts_items(force=False):
+    now = time.time()
+    with tts_prune_lock:
+        if not force and now - tts_last_prune[0] < TTS_PRUNE_INTERVAL:
+            return
+        tts_last_prune[0] = now
+
+    # Ids still played from /history are kept however old they are
+    keep = history_tts_ids()
+    cutoff = now - TTS_RETENTION
+
+    for name in os.listdir(TTS_DIR):
+        if name.split(".", 1)[0] in keep:
+            continue
+        path = os.path.join(TTS_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+try:
+    prune_tts_items(force=True)
+except Exception as e:
+    print("TTS Prune Error:", e)
+
+@app.route("/tts/<tts_id>")
+def stream_tts(tts_id):
+    if not TTS_ID_PATTERN.match(tts_id):
+        abort(404)
+
+    try:
+        with open(os.path.join(TTS_DIR, tts_id + ".json"), "r", encoding="utf-8") as f:
+            items = json.load(f)
+    except (OSError, ValueError):
+        abort(404)
+
+    try:
+        voices = [gTTS(text=text, lang=lang) for text, lang in items]
+    except (ValueError, AssertionError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        # MP3 frames can be concatenated, so bundles play back to back
+        for tts in voices:
+            yield from tts.stream()
+
+    # Concurrent requests for the same id share one gTTS call
+    chunks = singleflight_stream(f"tts:{tts_id}", generate)
+
+    # Fetch the first part before sending headers, so an upstream failure
+    # (e.g. gTTSError on a 429) is reported as a 502 instead of a 200
+    # with an empty MP3
+    try:
+        first_chunk = next(chunks, b"")
+    except Exception as e:
+        return jsonify({"error": f"Text-to-speech failed: {e}"}), 502
+
+    def stream():
+        yield first_chunk
+        yield from chunks
+
+    response = Response(stream_with_context(stream()), mimetype="audio/mpeg")
+
+    # A failure later in the stream can't be reported, so keep the audio
+    # out of shared caches and only let the browser reuse it briefly
+    response.cache_control.private = True
+    response.cache_control.max_age = TTS_MAX_AGE
+    return response
 
 # ============================================================
 # MULTI LANGUAGE TRANSLATION (WITH LIMIT + AUDIO)
@@ -427,18 +733,15 @@ def translate_multi():
     play_audio = data.get("playAudio", False)
 
     results = []
+    bundle = []
 
     for lang in languages:
-        translated = GoogleTranslator(source="auto", target=lang).translate(text)
+        translated, _ = translate_text(text, lang)
 
-        filename = ""
         audio_path = ""
 
         if play_audio:
-            filename = f"audio_{uuid.uuid4().hex}.mp3"
-            full_path = os.path.join("static/audio", filename)
-            gTTS(text=translated, lang=lang).save(full_path)
-            audio_path = f"/static/audio/{filename}"
+            audio_path = tts_url([(translated, lang)])
 
         ist=pytz.timezone("Asia/Kolkata")
         current_time = datetime.now(ist).strftime("%Y-%m-%d %H:%M-%S")
@@ -447,7 +750,8 @@ def translate_multi():
             "target_lang": lang,
             "original_text": text,
             "translated_text": translated,
-            "audio_file": filename,
+            "audio_file": "",
+            "audio_url": audio_path,
             "timestamp": current_time
         })
 
@@ -456,8 +760,15 @@ def translate_multi():
             "translated_text": translated,
             "audio_path": audio_path
         })
+        bundle.append((translated, lang))
+
+    response = {"translations": results}
+
+    # One stream that speaks every language back to back
+    if play_audio and bundle:
+        response["bundle_audio_path"] = tts_url(bundle)
 
-    return jsonify({"translations": results})
+    return jsonify(response)
 
 # ============================================================
 # BUY PLAN (WITH PDF RECEIPT + SESSION UPDATE)
@@ -543,7 +854,7 @@ def buy_plan():
     cursor.close()
     conn.close()
 
-    receipt_url = f"/static/receipts/{filename}"
+    receipt_url = url_for("static", filename=f"receipts/{filename}")
 
     return jsonify({
         "message": f"{extra_messages} translation credits added!",
@@ -576,6 +887,28 @@ def show_history():
 # ============================================================
 # IMAGE GENERATION
 # ============================================================
+GENERATED_DIR = os.path.join("static", "generated")
+GENERATED_RETENTION = float(os.getenv("GENERATED_RETENTION_HOURS", "24")) * 60 * 60
+GENERATED_PRUNE_INTERVAL = 60 * 60
+
+generated_last_prune = [0.0]
+generated_prune_lock = threading.Lock()
+
+def prune_generated_images():
+    now = time.time()
+    with generated_prune_lock:
+        if now - generated_last_prune[0] < GENERATED_PRUNE_INTERVAL:
+            return
+        generated_last_prune[0] = now
+
+    for name in os.listdir(GENERATED_DIR):
+        path = os.path.join(GENERATED_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > GENERATED_RETENTION:
+                os.remove(path)
+        except OSError:
+            pass
+
 @app.route("/image-gen", methods=["GET", "POST"])
 def image_gen():
     image_path = None
@@ -583,13 +916,27 @@ def image_gen():
 
     if request.method == "POST":
         prompt = request.form.get("prompt")
-        try:
+
+        def generate_image():
             image = client.text_to_image(
                 prompt=prompt,
                 model="stabilityai/stable-diffusion-xl-base-1.0"
             )
-            image_path = "static/generated.png"
-            image.save(image_path)
+            name = f"{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]}.png"
+            path = os.path.join(GENERATED_DIR, name)
+
+            # Write then rename so other workers never serve a partial PNG
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            image.save(tmp_path, format="PNG")
+            os.replace(tmp_path, path)
+
+            prune_generated_images()
+            return f"generated/{name}"
+
+        try:
+            image_path = asset_url(singleflight(
+                f"image-gen:{prompt}", generate_image, deadline=IMAGE_GEN_DEADLINE
+            ))
         except Exception as e:
             error = str(e)
 
@@ -664,6 +1011,26 @@ def toggle_admin(user_id):
 
     return redirect(url_for("admin_dashboard"))
 
+@app.route("/admin/singleflight")
+def singleflight_metrics():
+    if not session.get("email"):
+        return redirect(url_for("login"))
+
+    conn = get_db()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT is_admin FROM users2 WHERE email=%s", (session["email"],))
+    current_user = cursor.fetchone()
+
+    cursor.close()
+    conn.close()
+
+    if not current_user or not current_user[0]:
+        return "Unauthorized ❌", 403
+
+    # Summed over every worker on this host
+    return jsonify(singleflight_totals())
+
 # ============================================================
 # IMAGE TO TEXT
 # ============================================================
@@ -0,0 +1,289 @@
+# ============================================================
+# SINGLE-FLIGHT REQUEST COALESCING
+# ============================================================
+# Identical upstream calls (same text + language, same image prompt) share
+# one call. Within a worker, followers wait on the leader's Event. Across
+# gunicorn workers, the leader claims <digest>.lock with O_CREAT|O_EXCL and
+# publishes its result to <digest>.json, which other workers read for
+# SINGLEFLIGHT_RESULT_TTL seconds; only identical keys ever wait on each
+# other. Anyone waiting longer than the call site's deadline calls upstream
+# itself. Results must be JSON-serialisable.
+#
+# Streams (TTS audio) are coalesced within a worker only: a background
+# producer buffers the upstream parts and every caller with the same key
+# reads them from that buffer as they arrive.
+#
+# Counters are written per process to SINGLEFLIGHT_DIR/stats/ so
+# singleflight_totals() can report them for all workers on the host.
+import os
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+
+SINGLEFLIGHT_DEADLINE = float(os.getenv("SINGLEFLIGHT_DEADLINE", "15"))
+SINGLEFLIGHT_RESULT_TTL = float(os.getenv("SINGLEFLIGHT_RESULT_TTL", "5"))
+SINGLEFLIGHT_SWEEP_INTERVAL = 60
+SINGLEFLIGHT_DIR = os.getenv(
+    "SINGLEFLIGHT_DIR",
+    os.path.join(tempfile.gettempdir(), "translator-singleflight")
+)
+
+flights = {}
+stream_flights = {}
+flights_lock = threading.Lock()
+flights_last_sweep = [0.0]
+stats_file_lock = threading.Lock()
+stats_owner = {"pid": None, "name": None}
+singleflight_stats = {
+    # Calls that actually went upstream
+    "upstream_calls": 0,
+    # Waited on a leader in this worker
+    "coalesced_in_process": 0,
+    # Waited on a leader in another worker
+    "coalesced_cross_worker": 0,
+    # No leader running, but a result finished within SINGLEFLIGHT_RESULT_TTL
+    "reused_recent_result": 0,
+    # Gave up on a stalled leader and called upstream
+    "deadline_fallbacks": 0
+}
+
+def stats_path():
+    # Fresh name per process, including workers forked after import
+    if stats_owner["pid"] != os.getpid():
+        stats_owner["pid"] = os.getpid()
+        stats_owner["name"] = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+    return os.path.join(SINGLEFLIGHT_DIR, "stats", stats_owner["name"])
+
+def count_flight(name):
+    with flights_lock:
+        singleflight_stats[name] += 1
+
+    # Snapshot inside the file lock so the last write always has the latest counts
+    with stats_file_lock:
+        with flights_lock:
+            snapshot = dict(singleflight_stats)
+        path = stats_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+def singleflight_totals():
+    totals = dict.fromkeys(singleflight_stats, 0)
+    processes = 0
+
+    stats_dir = os.path.join(SINGLEFLIGHT_DIR, "stats")
+    names = os.listdir(stats_dir) if os.path.isdir(stats_dir) else []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(stats_dir, name), "r") as f:
+                counts = json.load(f)
+        except (OSError, ValueError):
+            continue
+        processes += 1
+        for key in totals:
+            totals[key] += counts.get(key, 0)
+
+    totals["processes"] = processes
+    with flights_lock:
+        totals["in_flight_this_worker"] = len(flights) + len(stream_flights)
+    return totals
+
+def read_flight_result(path):
+    try:
+        if time.time() - os.path.getmtime(path) > SINGLEFLIGHT_RESULT_TTL:
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def sweep_flight_results():
+    now = time.time()
+    with flights_lock:
+        if now - flights_last_sweep[0] < SINGLEFLIGHT_SWEEP_INTERVAL:
+            return
+        flights_last_sweep[0] = now
+
+    for name in os.listdir(SINGLEFLIGHT_DIR):
+        path = os.path.join(SINGLEFLIGHT_DIR, name)
+        if not os.path.isfile(path):
+            continue
+        # Locks are only abandoned by crashed leaders; give live ones room
+        max_age = 3600 if name.endswith(".lock") else SINGLEFLIGHT_SWEEP_INTERVAL
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
+
+def cross_worker_call(digest, fn, deadline):
+    os.makedirs(SINGLEFLIGHT_DIR, exist_ok=True)
+    lock_path = os.path.join(SINGLEFLIGHT_DIR, digest + ".lock")
+    result_path = os.path.join(SINGLEFLIGHT_DIR, digest + ".json")
+    give_up = time.time() + deadline
+    waited = False
+
+    while True:
+        published = read_flight_result(result_path)
+        if published is not None:
+            count_flight("coalesced_cross_worker" if waited else "reused_recent_result")
+            return published["result"]
+
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            waited = True
+
+        # A leader that crashed (or outlived the deadline) leaves its lock behind
+        try:
+            if time.time() - os.path.getmtime(lock_path) > deadline:
+                os.remove(lock_path)
+                continue
+        except OSError:
+            continue
+
+        if time.time() >= give_up:
+            count_flight("deadline_fallbacks")
+            count_flight("upstream_calls")
+            return fn()
+        time.sleep(0.05)
+
+    try:
+        # The previous leader may have published between our read and our lock
+        published = read_flight_result(result_path)
+        if published is not None:
+            count_flight("coalesced_cross_worker" if waited else "reused_recent_result")
+            return published["result"]
+
+        count_flight("upstream_calls")
+        result = fn()
+
+        tmp_path = f"{result_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"result": result}, f)
+        os.replace(tmp_path, result_path)
+
+        return result
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+        sweep_flight_results()
+
+def singleflight(key, fn, deadline=SINGLEFLIGHT_DEADLINE):
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    with flights_lock:
+        flight = flights.get(digest)
+        leader = flight is None
+        if leader:
+            flight = {"done": threading.Event(), "result": None, "error": None}
+            flights[digest] = flight
+
+    if not leader:
+        if not flight["done"].wait(deadline):
+            count_flight("deadline_fallbacks")
+            count_flight("upstream_calls")
+            return fn()
+
+        # Share the leader's failure instead of retrying a failing upstream
+        if flight["error"] is not None:
+            raise flight["error"]
+
+        count_flight("coalesced_in_process")
+        return flight["result"]
+
+    try:
+        flight["result"] = cross_worker_call(digest, fn, deadline)
+        return flight["result"]
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with flights_lock:
+            flights.pop(digest, None)
+        flight["done"].set()
+
+def produce_stream(digest, flight, open_stream):
+    try:
+        for chunk in open_stream():
+            with flights_lock:
+                flight["chunks"].append(chunk)
+                flight["changed"].notify_all()
+    except Exception as e:
+        with flights_lock:
+            flight["error"] = e
+    finally:
+        with flights_lock:
+            flight["done"] = True
+            if stream_flights.get(digest) is flight:
+                stream_flights.pop(digest)
+            flight["changed"].notify_all()
+
+def follow_stream(flight, open_stream, deadline):
+    index = 0
+
+    while True:
+        with flights_lock:
+            flight["changed"].wait_for(
+                lambda: index < len(flight["chunks"]) or flight["done"],
+                timeout=deadline
+            )
+            chunk = flight["chunks"][index] if index < len(flight["chunks"]) else None
+            done, error = flight["done"], flight["error"]
+
+        if chunk is not None:
+            index += 1
+            yield chunk
+        elif done:
+            if error is not None:
+                raise error
+            return
+        elif index == 0:
+            # Nothing sent yet, so we can still make our own call
+            count_flight("deadline_fallbacks")
+            count_flight("upstream_calls")
+            yield from open_stream()
+            return
+        else:
+            raise TimeoutError("Upstream stream stalled")
+
+def singleflight_stream(key, open_stream, deadline=SINGLEFLIGHT_DEADLINE):
+    # open_stream() returns an iterator of bytes. The upstream call runs in
+    # a background thread, so one client disconnecting doesn't cut it short
+    # for the others.
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    with flights_lock:
+        flight = stream_flights.get(digest)
+        leader = flight is None
+        if leader:
+            flight = {
+                "chunks": [],
+                "done": False,
+                "error": None,
+                "changed": threading.Condition(flights_lock)
+            }
+            stream_flights[digest] = flight
+
+    if leader:
+        count_flight("upstream_calls")
+        threading.Thread(
+            target=produce_stream, args=(digest, flight, open_stream), daemon=True
+        ).start()
+    else:
+        count_flight("coalesced_in_process")
+
+    return follow_stream(flight, open_stream, deadline)
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+import pytest
+
+import singleflight as sf
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(sf, "SINGLEFLIGHT_DIR", str(tmp_path))
+    monkeypatch.setattr(sf, "stats_owner", {"pid": None, "name": None})
+    for name in sf.singleflight_stats:
+        sf.singleflight_stats[name] = 0
+    sf.flights.clear()
+    sf.stream_flights.clear()
+    yield
+    sf.flights.clear()
+    sf.stream_flights.clear()
+
+
+def run_threads(count, target):
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_identical_keys_make_one_upstream_call():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.3)
+        return "hola"
+
+    results, errors = run_threads(8, lambda: sf.singleflight("translate:es:hello", fetch))
+
+    assert errors == []
+    assert results == ["hola"] * 8
+    assert len(calls) == 1
+    assert sf.singleflight_stats["upstream_calls"] == 1
+    assert sf.singleflight_stats["coalesced_in_process"] == 7
+
+
+def test_followers_reraise_leader_error():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.3)
+        raise RuntimeError("upstream down")
+
+    results, errors = run_threads(5, lambda: sf.singleflight("translate:es:fail", fetch))
+
+    assert results == []
+    assert len(errors) == 5
+    assert all(str(e) == "upstream down" for e in errors)
+    assert len(calls) == 1
+
+
+def test_followers_fall_back_after_deadline():
+    release = threading.Event()
+    leader_started = threading.Event()
+
+    def slow():
+        leader_started.set()
+        release.wait(5)
+        return "slow"
+
+    leader = threading.Thread(target=lambda: sf.singleflight("image-gen:cat", slow, deadline=5))
+    leader.start()
+    leader_started.wait(5)
+
+    started = time.time()
+    result = sf.singleflight("image-gen:cat", lambda: "own", deadline=0.2)
+    elapsed = time.time() - started
+
+    release.set()
+    leader.join()
+
+    assert result == "own"
+    assert 0.2 <= elapsed < 2
+    assert sf.singleflight_stats["deadline_fallbacks"] == 1
+
+
+def test_stale_lock_is_taken_over(tmp_path):
+    digest = hashlib.sha256(b"translate:fr:stale").hexdigest()
+    lock_path = tmp_path / f"{digest}.lock"
+    lock_path.write_text("")
+    old = time.time() - 60
+    os.utime(lock_path, (old, old))
+
+    started = time.time()
+    result = sf.singleflight("translate:fr:stale", lambda: "bonjour", deadline=5)
+
+    assert result == "bonjour"
+    assert time.time() - started < 1
+    assert sf.singleflight_stats["upstream_calls"] == 1
+    assert sf.singleflight_stats["deadline_fallbacks"] == 0
+    assert not lock_path.exists()
+
+
+def test_unrelated_keys_do_not_wait_on_each_other():
+    release = threading.Event()
+    leader = threading.Thread(
+        target=lambda: sf.singleflight("image-gen:slow", lambda: release.wait(5) and "slow", deadline=5)
+    )
+    leader.start()
+
+    started = time.time()
+    assert sf.singleflight("translate:de:hello", lambda: "hallo") == "hallo"
+    assert time.time() - started < 0.5
+
+    release.set()
+    leader.join()
+
+
+def test_recent_result_reuse_is_counted_separately():
+    assert sf.singleflight("translate:it:hello", lambda: "ciao") == "ciao"
+    # Another worker would see the published file, not this worker's Event
+    assert sf.singleflight("translate:it:hello", lambda: "other") == "ciao"
+
+    assert sf.singleflight_stats["upstream_calls"] == 1
+    assert sf.singleflight_stats["reused_recent_result"] == 1
+    assert sf.singleflight_stats["coalesced_cross_worker"] == 0
+
+
+def test_totals_sum_every_worker(tmp_path):
+    sf.singleflight("translate:pt:hello", lambda: "olá")
+
+    stats_dir = tmp_path / "stats"
+    (stats_dir / "999-other.json").write_text(json.dumps({"upstream_calls": 4, "coalesced_cross_worker": 2}))
+
+    totals = sf.singleflight_totals()
+    assert totals["processes"] == 2
+    assert totals["upstream_calls"] == 5
+    assert totals["coalesced_cross_worker"] == 2
+
+
+def test_stream_is_shared_between_callers():
+    calls = []
+
+    def open_stream():
+        calls.append(1)
+        for part in (b"ID3", b"frame-1", b"frame-2"):
+            time.sleep(0.05)
+            yield part
+
+    results, errors = run_threads(
+        4, lambda: b"".join(sf.singleflight_stream("tts:abc", open_stream))
+    )
+
+    assert errors == []
+    assert results == [b"ID3frame-1frame-2"] * 4
+    assert len(calls) == 1
+    assert sf.singleflight_stats["coalesced_in_process"] == 3
+
+
+def test_stream_error_reaches_every_caller():
+    def open_stream():
+        time.sleep(0.1)
+        raise RuntimeError("429 Too Many Requests")
+        yield b""
+
+    results, errors = run_threads(
+        3, lambda: b"".join(sf.singleflight_stream("tts:fail", open_stream))
+    )
+
+    assert results == []
+    assert [str(e) for e in errors] == ["429 Too Many Requests"] * 3
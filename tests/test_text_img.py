@@ -0,0 +1,58 @@
+import os
+import json
+import importlib.util
+
+from PIL import Image
+
+spec = importlib.util.spec_from_file_location(
+    "text_img", os.path.join(os.path.dirname(__file__), "..", "text-img.py")
+)
+text_img = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(text_img)
+
+
+def make_images(directory):
+    sizes = [(400, 200), (50, 80), (300, 300)]
+    colors = ["red", "green", "blue"]
+    for index, (size, color) in enumerate(zip(sizes, colors)):
+        Image.new("RGBA", size, color).save(os.path.join(directory, f"image_{index}.png"))
+    return sizes
+
+
+def read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_fake_model_batch_run_and_resume(tmp_path, capsys):
+    images = tmp_path / "images"
+    images.mkdir()
+    make_images(images)
+    output = tmp_path / "results.jsonl"
+
+    argv = [str(images), "-o", str(output), "--model", "fake", "--max-size", "100", "-w", "2"]
+    assert text_img.main(argv) == 0
+
+    records = read_records(output)
+    assert len(records) == 3
+    assert len({record["sha256"] for record in records}) == 3
+
+    responses = {os.path.basename(r["path"]): r["response"] for r in records}
+    assert "100x50 RGB" in responses["image_0.png"]
+    assert "50x80 RGB" in responses["image_1.png"]
+    assert "100x100 RGB" in responses["image_2.png"]
+
+    # Second run finds every hash in the manifest and does nothing
+    capsys.readouterr()
+    assert text_img.main(argv) == 0
+    assert "0 to analyze" in capsys.readouterr().out
+    assert len(read_records(output)) == 3
+
+
+def test_prepare_image_keeps_small_images(tmp_path):
+    path = tmp_path / "small.png"
+    Image.new("L", (20, 10)).save(path)
+
+    image = text_img.prepare_image(str(path), 100)
+    assert image.size == (20, 10)
+    assert image.mode == "L"
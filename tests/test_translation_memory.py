@@ -0,0 +1,124 @@
+import pytest
+
+import translation_memory as tm
+
+
+@pytest.fixture(autouse=True)
+def empty_memory():
+    tm.tm_clear()
+    yield
+    tm.tm_clear()
+
+
+def test_exact_repeat_is_served_from_memory():
+    tm.tm_add("fr", "Your order has been shipped", "Votre commande a été expédiée")
+
+    assert tm.tm_lookup("fr", "Your order has been shipped") == "Votre commande a été expédiée"
+    assert tm.tm_lookup("fr", "Your  order has been shipped") == "Votre commande a été expédiée"
+    assert tm.tm_lookup("de", "Your order has been shipped") is None
+
+
+def test_negation_is_not_served_from_memory():
+    tm.tm_add(
+        "fr",
+        "Your order has been shipped and will arrive within five business days",
+        "Votre commande a été expédiée et arrivera dans cinq jours ouvrables"
+    )
+
+    query = "Your order has not been shipped and will arrive within five business days"
+    assert tm.tm_lookup("fr", query) is None
+
+    # Still offered as a hint, never as the answer
+    similar = tm.tm_suggest("fr", query)
+    assert similar["original_text"].startswith("Your order has been shipped")
+    assert similar["score"] < 1
+
+
+def test_changed_number_is_substituted():
+    tm.tm_add("es", "Order 1042 has shipped", "El pedido 1042 ha sido enviado")
+
+    assert tm.tm_lookup("es", "Order 1043 has shipped") == "El pedido 1043 ha sido enviado"
+
+
+def test_changed_word_count_is_not_served():
+    tm.tm_add("es", "Order 1042 has shipped", "El pedido 1042 ha sido enviado")
+
+    assert tm.tm_lookup("es", "Order 1042 has not shipped") is None
+    assert tm.tm_lookup("es", "Order 1042 and 7 have shipped") is None
+
+
+def test_changed_name_copied_verbatim_is_substituted():
+    tm.tm_add("es", "Order 1042 for Alice has shipped", "El pedido 1042 para Alice ha sido enviado")
+
+    assert (
+        tm.tm_lookup("es", "Order 77 for Bob has shipped")
+        == "El pedido 77 para Bob ha sido enviado"
+    )
+
+
+def test_changed_name_not_copied_verbatim_must_match():
+    tm.tm_add("hi", "Welcome to Paris", "पेरिस में आपका स्वागत है")
+
+    assert tm.tm_lookup("hi", "Welcome to Paris") == "पेरिस में आपका स्वागत है"
+    assert tm.tm_lookup("hi", "Welcome to London") is None
+
+
+def test_repeated_value_is_not_substituted():
+    tm.tm_add("es", "Page 5 of 5", "Página 5 de 5")
+
+    assert tm.tm_lookup("es", "Page 5 of 5") == "Página 5 de 5"
+    assert tm.tm_lookup("es", "Page 4 of 5") is None
+
+
+def test_braces_in_translation_survive_substitution():
+    tm.tm_add("es", "Order 1042 shipped {ok}", "Pedido 1042 enviado {ok}")
+
+    assert tm.tm_lookup("es", "Order 9 shipped {ok}") == "Pedido 9 enviado {ok}"
+
+
+def test_suggest_skips_exact_template_and_unrelated_text():
+    tm.tm_add("fr", "Your order has been shipped", "Votre commande a été expédiée")
+
+    assert tm.tm_suggest("fr", "Your order has been shipped") is None
+    assert tm.tm_suggest("fr", "Completely unrelated sentence here") is None
+
+
+def test_suggest_ignores_overly_common_trigrams(monkeypatch):
+    monkeypatch.setattr(tm, "TM_MAX_POSTINGS", 3)
+    for word in ["apple", "bread", "chair", "drum", "egg"]:
+        tm.tm_add("fr", f"the {word} on the kitchen table is ready to serve", f"le {word} est prêt")
+
+    # Only "the ... is ready" overlaps, and those trigrams are in all five entries
+    assert tm.tm_suggest("fr", "the lamp on the kitchen table is ready to serve") is None
+
+    monkeypatch.setattr(tm, "TM_MAX_POSTINGS", 500)
+    assert tm.tm_suggest("fr", "the lamp on the kitchen table is ready to serve") is not None
+
+
+def test_title_case_input_is_not_masked():
+    tm.tm_add("es", "Hotel California", "Hotel California")
+    tm.tm_add("de", "Super Mario Party Deluxe", "Super Mario Party Deluxe")
+
+    assert tm.tm_lookup("es", "Welcome Home") is None
+    assert tm.tm_lookup("de", "Good Morning Dear Friend") is None
+
+    # Exact repeats are still served
+    assert tm.tm_lookup("es", "Hotel California") == "Hotel California"
+
+
+def test_sentence_initial_word_copied_unchanged_is_not_substituted():
+    tm.tm_add("es", "No changes saved", "No se guardaron cambios")
+    tm.tm_add("es", "Alice is here", "Alice está aquí")
+    tm.tm_add("es", "Done. Alice is here", "Hecho. Alice está aquí")
+
+    assert tm.tm_lookup("es", "All changes saved") is None
+    assert tm.tm_lookup("es", "Bob is here") is None
+    assert tm.tm_lookup("es", "Done. Bob is here") is None
+
+
+def test_segment_without_literal_words_is_not_served():
+    tm.tm_add("fr", "1042", "1042")
+    tm.tm_add("fr", "10:30 - 11:00", "10:30 - 11:00")
+
+    assert tm.tm_lookup("fr", "1043") is None
+    assert tm.tm_lookup("fr", "12:30 - 13:00") is None
@@ -1,40 +1,185 @@
 import os
+import sys
+import glob
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from PIL import Image
-import google.generativeai as genai
-from tkinter import Tk
-from tkinter.filedialog import askopenfilename
+from dotenv import load_dotenv
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp"}
+DEFAULT_PROMPT = "Describe this image in detail"
+DEFAULT_MODEL = "gemini-2.5-flash"
+FAKE_MODEL = "fake"
+
+
+# ============================================================
+# MODELS
+# ============================================================
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Offline stand-in for the Gemini model, used for testing the pipeline."""
+
+    def generate_content(self, parts):
+        prompt, image = parts
+        return FakeResponse(
+            f"[fake] {prompt}: {image.width}x{image.height} {image.mode} image"
+        )
+
+
+def load_model(model_name, api_key):
+    if model_name == FAKE_MODEL:
+        return FakeModel()
+
+    import google.generativeai as genai
+
+    if not api_key:
+        sys.exit("No API key found. Set Gemini_API or pass --api-key.")
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name=model_name)
+
+
+# ============================================================
+# INPUT DISCOVERY
+# ============================================================
+def collect_images(sources):
+    paths = []
+
+    for source in sources:
+        if os.path.isdir(source):
+            matches = glob.glob(os.path.join(source, "**", "*"), recursive=True)
+        else:
+            matches = glob.glob(source, recursive=True)
+
+        for path in matches:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.abspath(path))
+
+    # De-duplicate while keeping a stable order
+    return sorted(set(paths))
+
 
-# 1. Configure the API Key
-genai.configure(api_key="YOUR_API_KEY_HERE")  # Replace with your valid key
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-# 2. Open file picker dialog
-Tk().withdraw()  # Hide the root tkinter window
-image_path = askopenfilename(
-    title="Select an image",
-    filetypes=[("Image Files", "*.png *.jpg *.jpeg *.bmp *.gif")]
-)
 
-if not image_path:
-    print("No image selected. Exiting.")
-    exit()
+# ============================================================
+# MANIFEST (RESUME SUPPORT)
+# ============================================================
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return set()
 
-# 3. Load the selected image
-image = Image.open(image_path)
+    with open(manifest_path, "r") as f:
+        return {line.strip() for line in f if line.strip()}
 
-# 4. Use the Gemini multimodal model
-model = genai.GenerativeModel(model_name="gemini-1.5-flash")
 
-# 5. Send prompt and image
-prompt = "Describe this image in detail"
+# ============================================================
+# ANALYSIS
+# ============================================================
+def prepare_image(path, max_size):
+    with Image.open(path) as image:
+        # Downsize before upload; the model doesn't need full-resolution pixels
+        if max_size and max(image.size) > max_size:
+            image.thumbnail((max_size, max_size))
 
-print("Analyzing the image...")
+        if image.mode not in ("RGB", "L"):
+            return image.convert("RGB")
 
-try:
+        # Detach from the file so the handle closes with the block
+        return image.copy()
+
+
+def analyze_image(model, path, prompt, max_size):
+    image = prepare_image(path, max_size)
     response = model.generate_content([prompt, image])
+    return response.text
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analyze a directory or glob of images with Gemini and write results as JSONL."
+    )
+    parser.add_argument("sources", nargs="+", help="Image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="image_results.jsonl", help="JSONL output file")
+    parser.add_argument("--manifest", help="File of completed content hashes (default: <output>.done)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Concurrent requests")
+    parser.add_argument("--max-size", type=int, default=1024, help="Longest image side sent to the model (0 = original)")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"Model name, or '{FAKE_MODEL}' for offline testing")
+    parser.add_argument("--api-key", default=None, help="Gemini API key (default: Gemini_API env var)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    load_dotenv()
+    args = parse_args(argv)
+
+    manifest_path = args.manifest or f"{args.output}.done"
+    completed = load_manifest(manifest_path)
+
+    images = collect_images(args.sources)
+    if not images:
+        print("No images found. Exiting.")
+        return 1
+
+    pending = []
+    seen = set(completed)
+    for path in images:
+        content_hash = file_hash(path)
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        pending.append((path, content_hash))
+
+    print(f"Found {len(images)} images, {len(images) - len(pending)} already done, {len(pending)} to analyze...")
+    if not pending:
+        return 0
+
+    model = load_model(args.model, args.api_key or os.getenv("Gemini_API"))
+    failures = 0
+
+    with open(args.output, "a", encoding="utf-8") as out, \
+            open(manifest_path, "a", encoding="utf-8") as manifest, \
+            ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+
+        futures = {
+            pool.submit(analyze_image, model, path, args.prompt, args.max_size): (path, content_hash)
+            for path, content_hash in pending
+        }
+
+        for future in as_completed(futures):
+            path, content_hash = futures[future]
+
+            try:
+                record = {"path": path, "sha256": content_hash, "model": args.model, "response": future.result()}
+            except Exception as e:
+                failures += 1
+                print(f"Error analyzing {path}: {e}")
+                continue
+
+            # Result first, then manifest, so a crash never marks unsaved work as done
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            manifest.write(content_hash + "\n")
+            manifest.flush()
+
+            print(f"Done: {path}")
+
+    print(f"Finished with {failures} failure(s). Results in {args.output}")
+    return 1 if failures else 0
 
-    # 6. Print result
-    print("\nModel's response:")
-    print(response.text)
 
-except Exception as e:
-    print(f"\nAn unexpected error occurred: {e}")
+if __name__ == "__main__":
+    sys.exit(main())
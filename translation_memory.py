@@ -0,0 +1,182 @@
+# ============================================================
+# TRANSLATION MEMORY
+# ============================================================
+# Past translations are stored under a template in which numbers and
+# capitalised words (names) are masked as placeholders. A new segment is
+# answered locally only when its template matches a stored one exactly
+# ("Order 1042 has shipped" vs "Order 1043 has shipped"). A placeholder is
+# substituted into the stored translation only if its value was copied
+# verbatim by the translator; otherwise the value has to match exactly.
+#
+# The first word of a sentence is never treated as a name, and names are
+# only masked while the segment keeps more literal words than names, so
+# Title Case strings ("Good Morning Dear Friend") match only exact repeats.
+# Templates with fewer than TM_MIN_LITERAL_CHARS letters outside the
+# placeholders are never answered from memory.
+#
+# Near-duplicates that differ in unmasked words ("has not shipped") are never
+# answered from memory. A character-trigram index finds them only as a hint
+# (tm_suggest) for the caller to show next to the real translation.
+import os
+import re
+import heapq
+import threading
+
+TM_THRESHOLD = float(os.getenv("TM_FUZZY_THRESHOLD", "0.8"))
+TM_MIN_LENGTH = int(os.getenv("TM_MIN_LENGTH", "4"))
+TM_MIN_LITERAL_CHARS = int(os.getenv("TM_MIN_LITERAL_CHARS", "3"))
+# Trigrams shared by more entries than this carry no signal and are skipped,
+# so suggestion scores are a lower bound
+TM_MAX_POSTINGS = int(os.getenv("TM_MAX_POSTINGS", "500"))
+TM_MAX_CANDIDATES = int(os.getenv("TM_MAX_CANDIDATES", "50"))
+TM_SLOT = "⦀"
+PLACEHOLDER_PATTERN = re.compile(r"\d+(?:[.,:]\d+)*|\b[A-Z][\w'-]*")
+SENTENCE_END_PATTERN = re.compile(r"[.!?:;\n]\s*$")
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+tm_entries = []
+tm_exact = {}
+tm_index = {}
+tm_lock = threading.Lock()
+
+def tm_template(text):
+    text = " ".join(text.split())
+
+    numbers, names = [], []
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        if match.group()[0].isdigit():
+            numbers.append(match)
+        elif match.start() and not SENTENCE_END_PATTERN.search(text[:match.start()]):
+            names.append(match)
+
+    literal = text
+    for match in reversed(numbers + names):
+        literal = literal[:match.start()] + " " + literal[match.end():]
+
+    # Too few ordinary words left: the "names" are most likely a Title Case phrase
+    if len(names) >= len(WORD_PATTERN.findall(literal)):
+        names = []
+
+    masked = sorted(numbers + names, key=lambda match: match.start())
+    parts, position = [], 0
+    for match in masked:
+        parts.append(text[position:match.start()].lower())
+        parts.append(TM_SLOT)
+        position = match.end()
+    parts.append(text[position:].lower())
+
+    return "".join(parts), [match.group() for match in masked]
+
+def tm_literal_chars(template):
+    return sum(char.isalpha() for char in template)
+
+def tm_trigrams(template):
+    padded = f"  {template} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def tm_clear():
+    with tm_lock:
+        tm_entries.clear()
+        tm_exact.clear()
+        tm_index.clear()
+
+def tm_add(lang, text, translated):
+    if not text or not translated or len(text) < TM_MIN_LENGTH:
+        return
+
+    template, values = tm_template(text)
+    if tm_literal_chars(template) < TM_MIN_LITERAL_CHARS:
+        return
+
+    # Only values that occur once in the source and verbatim in the
+    # translation can be swapped for a new value later on
+    substitutable = {
+        value: index for index, value in enumerate(values)
+        if values.count(value) == 1
+        and re.search(rf"(?<!\w){re.escape(value)}(?!\w)", translated)
+    }
+
+    translated_template = translated.replace("{", "{{").replace("}", "}}")
+    if substitutable:
+        pattern = re.compile(
+            r"(?<!\w)(" + "|".join(
+                re.escape(v) for v in sorted(substitutable, key=len, reverse=True)
+            ) + r")(?!\w)"
+        )
+        translated_template = pattern.sub(
+            lambda m: "{%d}" % substitutable[m.group(1)],
+            translated_template
+        )
+
+    slots = [
+        None if index in substitutable.values() else value
+        for index, value in enumerate(values)
+    ]
+    trigrams = tm_trigrams(template)
+
+    with tm_lock:
+        variants = tm_exact.setdefault((lang, template), [])
+        if any(tm_entries[entry_id][3] == slots for entry_id in variants):
+            return
+
+        entry_id = len(tm_entries)
+        tm_entries.append((lang, template, len(trigrams), slots, translated_template, text, translated))
+        variants.append(entry_id)
+        for trigram in trigrams:
+            tm_index.setdefault((lang, trigram), set()).add(entry_id)
+
+def tm_lookup(lang, text):
+    if len(text) < TM_MIN_LENGTH:
+        return None
+
+    template, values = tm_template(text)
+    if tm_literal_chars(template) < TM_MIN_LITERAL_CHARS:
+        return None
+
+    with tm_lock:
+        variants = list(tm_exact.get((lang, template), ()))
+
+    for entry_id in variants:
+        slots, translated_template = tm_entries[entry_id][3:5]
+        if any(slot is not None and slot != value for slot, value in zip(slots, values)):
+            continue
+        return translated_template.format(*values)
+
+    return None
+
+def tm_suggest(lang, text):
+    if len(text) < TM_MIN_LENGTH or TM_THRESHOLD > 1:
+        return None
+
+    template, _ = tm_template(text)
+    trigrams = tm_trigrams(template)
+
+    # Copy the postings under the lock, score without it. Entries are only
+    # ever appended, so ids taken here stay valid.
+    with tm_lock:
+        postings = [
+            list(entries) for entries in (tm_index.get((lang, trigram)) for trigram in trigrams)
+            if entries and len(entries) <= TM_MAX_POSTINGS
+        ]
+
+    shared = {}
+    for entries in postings:
+        for entry_id in entries:
+            shared[entry_id] = shared.get(entry_id, 0) + 1
+
+    best = None
+    for count, entry_id in heapq.nlargest(
+            TM_MAX_CANDIDATES, ((count, entry_id) for entry_id, count in shared.items())):
+        _, entry_template, trigram_count, _, _, original, translated = tm_entries[entry_id]
+        if entry_template == template:
+            continue
+
+        score = 2 * count / (len(trigrams) + trigram_count)
+        if score >= TM_THRESHOLD and (best is None or score > best["score"]):
+            best = {
+                "score": round(score, 3),
+                "original_text": original,
+                "translated_text": translated
+            }
+
+    return best